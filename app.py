@@ -1,83 +1,401 @@
 import os
+import re
 import math
-import psycopg2
+import json
+import hashlib
+import atexit
+import threading
+import redis
+from collections import defaultdict
+from contextlib import contextmanager
+from psycopg2.errors import CheckViolation
+from psycopg2.extensions import connection as PGConnection
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from flask import Flask, render_template, request, redirect
-from datetime import datetime
+from flask_caching import Cache
+from flask_compress import Compress
 
 app = Flask(__name__)
 
+# Gzip HTML responses, and drop the blank lines Jinja block tags leave behind
+app.config['COMPRESS_ALGORITHM'] = 'gzip'
+app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_MIN_SIZE'] = 500
+Compress(app)
+app.jinja_env.trim_blocks = True
+app.jinja_env.lstrip_blocks = True
+
 # --- Database Connection ---
 DATABASE_URL = os.environ.get('DATABASE_URL')  # set on Render
 
+# Listing pages only show a preview, so don't ship whole posts (or tsv)
+# for them
+SNIPPET_CHARS = 300
+LIST_COLUMNS = f'''
+    t.id, t.title, left(t.content, {SNIPPET_CHARS}) AS snippet, t.created_at,
+    t.upvotes, t.downvotes, t.tags, length(t.content) > {SNIPPET_CHARS} AS truncated
+'''
+
+# Hot statements: name -> (parameter types, SQL). Each is parsed and planned
+# the first time a connection runs it, then reused with EXECUTE name(...).
+PREPARED = {
+    'latest_threads': ('int, int', f'''
+        SELECT {LIST_COLUMNS} FROM threads t
+        WHERE t.id < $1
+        ORDER BY t.id DESC
+        LIMIT $2
+    '''),
+    'threads_by_tag': ('citext, int, int', f'''
+        SELECT {LIST_COLUMNS} FROM threads t
+        JOIN thread_tags tt ON tt.thread_id = t.id
+        JOIN tags g ON g.id = tt.tag_id
+        WHERE g.name = $1 AND t.id < $2
+        ORDER BY t.id DESC
+        LIMIT $3
+    '''),
+    'search_threads': ('text, int, int', f'''
+        SELECT {LIST_COLUMNS}, COUNT(*) OVER () AS total
+        FROM threads t, plainto_tsquery('english', $1) AS q
+        WHERE t.tsv @@ q
+        ORDER BY ts_rank(t.tsv, q) DESC, t.id DESC
+        LIMIT $2 OFFSET $3
+    '''),
+    'popular_threads': ('int', 'SELECT id, title, upvotes, downvotes FROM threads ORDER BY score DESC, id DESC LIMIT $1'),
+    # Columns are listed so schema changes don't invalidate the cached plans
+    'thread_by_id': ('int', '''
+        SELECT id, title, content, created_at, upvotes, downvotes, tags
+        FROM threads WHERE id = $1
+    '''),
+    'comments_by_thread': ('int', '''
+        SELECT id, content, created_at, upvotes, downvotes
+        FROM comments WHERE thread_id = $1 ORDER BY id ASC
+    '''),
+}
+
+class BoardConnection(PGConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()  # names of PREPARED statements on this session
+
+# One pool per process, with all POOL_MAX connections opened when the worker
+# imports the app. getconn() holds the pool lock while it connects, and under
+# psycogreen that connect yields to other greenlets with the lock still held,
+# so no connect should happen on the request path. Under gevent workers (see
+# gunicorn.conf.py) many requests share the pool, so checkouts wait for a
+# free slot instead of raising PoolError when all connections are busy.
+POOL_MAX = int(os.environ.get('DB_POOL_MAX', 20))
+POOL = ThreadedConnectionPool(
+    # putconn() closes returned connections once minconn are idle, so keep
+    # minconn at maxconn or every checkout past the first few reconnects
+    minconn=POOL_MAX,
+    maxconn=POOL_MAX,
+    dsn=DATABASE_URL,
+    connection_factory=BoardConnection,
+    cursor_factory=RealDictCursor  # rows come back as dicts keyed by column name
+)
+POOL_SLOTS = threading.BoundedSemaphore(POOL_MAX)
+atexit.register(POOL.closeall)
+
+@contextmanager
 def get_conn():
-    return psycopg2.connect(DATABASE_URL)
+    with POOL_SLOTS:
+        conn = POOL.getconn()
+        try:
+            yield conn
+        finally:
+            POOL.putconn(conn)
+
+def execute_prepared(c, name, args):
+    # PREPARE on first use only, so a short-lived connection pays for just
+    # the statement it actually runs. PREPARE isn't undone by a rollback.
+    conn = c.connection
+    if name not in conn.prepared:
+        types, sql = PREPARED[name]
+        c.execute(f'PREPARE {name}({types}) AS {sql}')
+        conn.prepared.add(name)
+    c.execute(f'EXECUTE {name}({", ".join(["%s"] * len(args))})', args)
+
+# --- Cache ---
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+R = redis.Redis.from_url(REDIS_URL)
+
+# Listing pages are cached whole for a short while, keyed by path and query
+# string (see listing_cache_key). Votes just wait out the TTL; a new thread
+# retires them right away.
+cache = Cache(app, config={
+    'CACHE_TYPE': 'RedisCache',
+    'CACHE_REDIS_URL': REDIS_URL,
+    'CACHE_KEY_PREFIX': 'page:',
+    'CACHE_DEFAULT_TIMEOUT': 20,
+})
+
+# Sidebar data is shown on every listing page; keep it briefly in Redis
+SIDEBAR_TTL = 60
+POPULAR_KEY = 'popular:v2'
+TRENDING_KEY = 'trending:v1'
+
+# Redis is only a cache: if it's down, log it and fall back to the database
+def redis_get(key):
+    try:
+        return R.get(key)
+    except redis.RedisError:
+        app.logger.warning('Redis GET %s failed', key, exc_info=True)
+        return None
+
+def redis_setex(key, ttl, value):
+    try:
+        R.setex(key, ttl, value)
+    except redis.RedisError:
+        app.logger.warning('Redis SETEX %s failed', key, exc_info=True)
+
+def redis_delete(*keys):
+    try:
+        R.delete(*keys)
+    except redis.RedisError:
+        app.logger.warning('Redis DEL %s failed', ' '.join(keys), exc_info=True)
+
+def redis_incr(key):
+    try:
+        R.incr(key)
+    except redis.RedisError:
+        app.logger.warning('Redis INCR %s failed', key, exc_info=True)
+
+# Cached listing keys carry a generation number. Bumping it retires every
+# cached page at once without scanning Redis for them; old ones just expire.
+LISTING_GEN_KEY = 'listing:gen'
+
+def listing_cache_key(*args, **kwargs):
+    gen = (redis_get(LISTING_GEN_KEY) or b'0').decode()
+    query = str(sorted(request.args.items(multi=True))).encode()
+    return f'{gen}:{request.path}:{hashlib.md5(query).hexdigest()}'
+
+# --- Vote Buffer ---
+# Votes are counted in memory and written in one batched transaction every
+# few seconds (or once enough pile up) instead of one commit per click.
+# Only the background flusher writes; requests never wait on the database.
+VOTE_FLUSH_SECONDS = 2
+VOTE_FLUSH_MAX = 100  # wake the flusher early once this many rows are pending
+VOTE_BUFFER = defaultdict(int)  # (table, 'up' | 'down', id) -> pending votes
+VOTE_LOCK = threading.Lock()
+VOTE_FLUSH_NOW = threading.Event()
+
+FLUSH_SQL = {
+    'threads': '''
+        UPDATE threads
+        SET upvotes = upvotes + v.up, downvotes = downvotes + v.down, score = score + v.up - v.down
+        FROM (VALUES %s) AS v(id, up, down)
+        WHERE threads.id = v.id
+    ''',
+    'comments': '''
+        UPDATE comments
+        SET upvotes = upvotes + v.up, downvotes = downvotes + v.down
+        FROM (VALUES %s) AS v(id, up, down)
+        WHERE comments.id = v.id
+    ''',
+}
+
+def record_vote(table, direction, row_id):
+    with VOTE_LOCK:
+        VOTE_BUFFER[(table, direction, row_id)] += 1
+        if len(VOTE_BUFFER) >= VOTE_FLUSH_MAX:
+            VOTE_FLUSH_NOW.set()
+
+def flush_votes():
+    with VOTE_LOCK:
+        if not VOTE_BUFFER:
+            return
+        pending = dict(VOTE_BUFFER)
+        VOTE_BUFFER.clear()
+
+    # Collapse into one (id, up, down) row per voted thread/comment
+    rows = {table: defaultdict(lambda: [0, 0]) for table in FLUSH_SQL}
+    for (table, direction, row_id), n in pending.items():
+        rows[table][row_id][0 if direction == 'up' else 1] += n
+
+    try:
+        with get_conn() as conn:
+            c = conn.cursor()
+            for table, sql in FLUSH_SQL.items():
+                if rows[table]:
+                    execute_values(c, sql, [(row_id, up, down) for row_id, (up, down) in rows[table].items()])
+            conn.commit()
+    except Exception:
+        # Put the counts back so the next flush retries them
+        with VOTE_LOCK:
+            for key, n in pending.items():
+                VOTE_BUFFER[key] += n
+        app.logger.exception('Vote flush failed')
+        return
+
+    if rows['threads']:
+        redis_delete(POPULAR_KEY)
+
+def vote_flusher():
+    while True:
+        VOTE_FLUSH_NOW.wait(timeout=VOTE_FLUSH_SECONDS)
+        VOTE_FLUSH_NOW.clear()
+        try:
+            flush_votes()
+        except Exception:
+            # Never let one bad flush stop the flusher for the worker's life
+            app.logger.exception('Vote flusher iteration failed')
+
+threading.Thread(target=vote_flusher, daemon=True).start()
+atexit.register(flush_votes)
 
 # --- Database Setup ---
 def init_db():
-    conn = get_conn()
-    c = conn.cursor()
-    
-    # Threads table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS threads (
-        id SERIAL PRIMARY KEY,
-        title TEXT NOT NULL,
-        content TEXT NOT NULL,
-        created_at TIMESTAMP NOT NULL,
-        upvotes INTEGER DEFAULT 0,
-        downvotes INTEGER DEFAULT 0,
-        tags TEXT DEFAULT ''
-    )
-    ''')
-    
-    # Comments table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS comments (
-        id SERIAL PRIMARY KEY,
-        thread_id INTEGER NOT NULL REFERENCES threads(id) ON DELETE CASCADE,
-        content TEXT NOT NULL,
-        created_at TIMESTAMP NOT NULL,
-        upvotes INTEGER DEFAULT 0,
-        downvotes INTEGER DEFAULT 0
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with get_conn() as conn:
+        c = conn.cursor()
+
+        # Threads table
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS threads (
+            id SERIAL PRIMARY KEY,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            upvotes INTEGER DEFAULT 0,
+            downvotes INTEGER DEFAULT 0,
+            tags TEXT DEFAULT ''
+        )
+        ''')
+
+        # Comments table
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS comments (
+            id SERIAL PRIMARY KEY,
+            thread_id INTEGER NOT NULL REFERENCES threads(id) ON DELETE CASCADE,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            upvotes INTEGER DEFAULT 0,
+            downvotes INTEGER DEFAULT 0
+        )
+        ''')
+        # Let Postgres stamp new rows (tables created before the default existed)
+        c.execute('ALTER TABLE threads ALTER COLUMN created_at SET DEFAULT NOW()')
+        c.execute('ALTER TABLE comments ALTER COLUMN created_at SET DEFAULT NOW()')
+
+        # Thread pages read comments by thread in id order
+        c.execute('CREATE INDEX IF NOT EXISTS comments_thread_id_id ON comments (thread_id, id)')
+
+        # Denormalized vote score so popular threads is an index top-N
+        c.execute('ALTER TABLE threads ADD COLUMN IF NOT EXISTS score INTEGER NOT NULL DEFAULT 0')
+        c.execute('''
+        UPDATE threads SET score = coalesce(upvotes, 0) - coalesce(downvotes, 0)
+        WHERE score <> coalesce(upvotes, 0) - coalesce(downvotes, 0)
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS threads_score_desc ON threads (score DESC, id DESC)')
+
+        # Tags, one row per name; threads.tags stays as the display copy
+        c.execute('CREATE EXTENSION IF NOT EXISTS citext')
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS tags (
+            id SERIAL PRIMARY KEY,
+            name CITEXT NOT NULL UNIQUE
+        )
+        ''')
+        c.execute('''
+        CREATE TABLE IF NOT EXISTS thread_tags (
+            thread_id INTEGER NOT NULL REFERENCES threads(id) ON DELETE CASCADE,
+            tag_id INTEGER NOT NULL REFERENCES tags(id),
+            PRIMARY KEY (thread_id, tag_id)
+        )
+        ''')
+        # (tag_id, thread_id) serves both the tag filter's id cursor and trending counts
+        c.execute('CREATE INDEX IF NOT EXISTS thread_tags_tag_id ON thread_tags (tag_id, thread_id)')
+        # Backfill from the comma-separated column
+        c.execute('''
+        INSERT INTO tags (name)
+        SELECT DISTINCT lower(trim(t)) FROM threads, unnest(string_to_array(tags, ',')) AS t
+        WHERE trim(t) <> ''
+        ON CONFLICT (name) DO NOTHING
+        ''')
+        c.execute('''
+        INSERT INTO thread_tags (thread_id, tag_id)
+        SELECT DISTINCT th.id, g.id
+        FROM threads th
+        CROSS JOIN LATERAL unnest(string_to_array(th.tags, ',')) AS t
+        JOIN tags g ON g.name = lower(trim(t))
+        ON CONFLICT DO NOTHING
+        ''')
+        # Tag filter and search no longer use ILIKE
+        c.execute('DROP INDEX IF EXISTS threads_tags_trgm')
+        c.execute('DROP INDEX IF EXISTS threads_title_trgm')
+        c.execute('DROP INDEX IF EXISTS threads_content_trgm')
+
+        # Full-text search column, kept up to date by trigger
+        c.execute('ALTER TABLE threads ADD COLUMN IF NOT EXISTS tsv tsvector')
+        c.execute('CREATE INDEX IF NOT EXISTS threads_tsv_gin ON threads USING GIN (tsv)')
+        c.execute('DROP TRIGGER IF EXISTS threads_tsv_update ON threads')
+        c.execute('''
+        CREATE TRIGGER threads_tsv_update BEFORE INSERT OR UPDATE OF title, content, tags ON threads
+        FOR EACH ROW EXECUTE FUNCTION
+        tsvector_update_trigger(tsv, 'pg_catalog.english', title, content, tags)
+        ''')
+        # Backfill rows created before the trigger existed
+        c.execute('''
+        UPDATE threads
+        SET tsv = to_tsvector('pg_catalog.english', title || ' ' || content || ' ' || coalesce(tags, ''))
+        WHERE tsv IS NULL
+        ''')
+
+        # Word limits enforced by the DB too, in case the route check is bypassed.
+        # NOT VALID skips re-checking existing rows on every startup.
+        for table, name, limit in (
+            ('threads', 'thread_wc', MAX_THREAD_WORDS),
+            ('comments', 'comment_wc', MAX_COMMENT_WORDS),
+        ):
+            c.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}')
+            c.execute(f'''
+            ALTER TABLE {table} ADD CONSTRAINT {name}
+            CHECK (array_length(regexp_split_to_array(regexp_replace(content, '^\\s+|\\s+$', '', 'g'), '\\s+'), 1) <= {limit})
+            NOT VALID
+            ''')
+
+        conn.commit()
 
 
 # --- Word Limits ---
 MAX_THREAD_WORDS = 500
 MAX_COMMENT_WORDS = 150
+WORD_RE = re.compile(r'\S+')
 
-def count_words(text):
-    return len(text.strip().split())
+def too_many_words(text, limit):
+    # Stops scanning as soon as the limit is passed
+    for n, _ in enumerate(WORD_RE.finditer(text), 1):
+        if n > limit:
+            return True
+    return False
+
+
+# --- Pagination ---
+# Listings page by id cursor (?before=<id>) instead of OFFSET, so every
+# page is a short index seek on the primary key.
+MAX_ID = 2**31 - 1  # SERIAL upper bound; "id < MAX_ID" matches every row
+
+def clamp(value, low, high):
+    # Keep query args inside the prepared statements' int parameters
+    return max(low, min(value, high))
 
 
 # --- Home Page with Pagination ---
 @app.route('/')
+@cache.cached(make_cache_key=listing_cache_key)
 def index():
-    page = int(request.args.get('page', 1))
+    before = clamp(request.args.get('before', MAX_ID, type=int), 0, MAX_ID)
     per_page = 5
-    offset = (page - 1) * per_page
-
-    conn = get_conn()
-    c = conn.cursor()
 
-    # Count total threads for pagination
-    c.execute('SELECT COUNT(*) FROM threads')
-    total_threads = c.fetchone()[0]
-    total_pages = math.ceil(total_threads / per_page)
+    with get_conn() as conn:
+        c = conn.cursor()
 
-    # Fetch threads for the current page
-    c.execute('''
-        SELECT * FROM threads
-        ORDER BY id DESC
-        LIMIT %s OFFSET %s
-    ''', (per_page, offset))
-    threads = c.fetchall()
+        # Fetch one extra row to know whether there is an older page
+        execute_prepared(c, 'latest_threads', (before, per_page + 1))
+        threads = c.fetchall()
 
-    conn.close()
+    next_before = threads[per_page - 1]['id'] if len(threads) > per_page else None
+    threads = threads[:per_page]
 
     popular_threads = get_popular_threads()
     trending_tags = get_trending_tags()
@@ -87,8 +405,8 @@ def index():
         threads=threads,
         popular_threads=popular_threads,
         trending_tags=trending_tags,
-        page=page,
-        total_pages=total_pages
+        before=before if before != MAX_ID else None,
+        next_before=next_before
     )
 
 
@@ -100,110 +418,108 @@ def new_thread():
         content = request.form['content']
         tags = request.form.get('tags', '')
 
-        if count_words(content) > MAX_THREAD_WORDS:
+        if too_many_words(content, MAX_THREAD_WORDS):
             return f"Thread too long! Max {MAX_THREAD_WORDS} words.", 400
 
-        conn = get_conn()
-        c = conn.cursor()
-        c.execute(
-            'INSERT INTO threads (title, content, created_at, tags) VALUES (%s, %s, %s, %s)',
-            (title, content, datetime.now(), tags)
-        )
-        conn.commit()
-        conn.close()
+        tag_names = list(dict.fromkeys(
+            t.strip().lower() for t in tags.split(',') if t.strip()
+        ))
+
+        with get_conn() as conn:
+            c = conn.cursor()
+            try:
+                c.execute(
+                    'INSERT INTO threads (title, content, tags) VALUES (%s, %s, %s) RETURNING id',
+                    (title, content, tags)
+                )
+            except CheckViolation:
+                # The DB's word count can disagree with ours on odd whitespace
+                return f"Thread too long! Max {MAX_THREAD_WORDS} words.", 400
+            thread_id = c.fetchone()['id']
+            if tag_names:
+                c.execute(
+                    'INSERT INTO tags (name) SELECT unnest(%s::citext[]) ON CONFLICT (name) DO NOTHING',
+                    (tag_names,)
+                )
+                c.execute(
+                    'INSERT INTO thread_tags (thread_id, tag_id) SELECT %s, id FROM tags WHERE name = ANY(%s::citext[])',
+                    (thread_id, tag_names)
+                )
+            conn.commit()
+        redis_delete(TRENDING_KEY)
+        redis_incr(LISTING_GEN_KEY)
         return redirect('/')
     return render_template('new_thread.html')
 
 
 # --- Thread Detail + Comments ---
-@app.route('/thread/<int:thread_id>', methods=['GET', 'POST'])
+@app.route(f'/thread/<int(max={MAX_ID}):thread_id>', methods=['GET', 'POST'])
 def thread_detail(thread_id):
-    conn = get_conn()
-    c = conn.cursor()
-
-    if request.method == 'POST':
-        content = request.form['content']
-        if count_words(content) > MAX_COMMENT_WORDS:
-            return f"Comment too long! Max {MAX_COMMENT_WORDS} words.", 400
-        c.execute(
-            'INSERT INTO comments (thread_id, content, created_at) VALUES (%s, %s, %s)',
-            (thread_id, content, datetime.now())
-        )
-        conn.commit()
+    with get_conn() as conn:
+        c = conn.cursor()
 
-    c.execute('SELECT * FROM threads WHERE id = %s', (thread_id,))
-    thread = c.fetchone()
-    c.execute('SELECT * FROM comments WHERE thread_id = %s ORDER BY id ASC', (thread_id,))
-    comments = c.fetchall()
-    conn.close()
+        if request.method == 'POST':
+            content = request.form['content']
+            if too_many_words(content, MAX_COMMENT_WORDS):
+                return f"Comment too long! Max {MAX_COMMENT_WORDS} words.", 400
+            try:
+                c.execute(
+                    'INSERT INTO comments (thread_id, content) VALUES (%s, %s)',
+                    (thread_id, content)
+                )
+            except CheckViolation:
+                return f"Comment too long! Max {MAX_COMMENT_WORDS} words.", 400
+            conn.commit()
+
+        execute_prepared(c, 'thread_by_id', (thread_id,))
+        thread = c.fetchone()
+        execute_prepared(c, 'comments_by_thread', (thread_id,))
+        comments = c.fetchall()
     return render_template('thread_detail.html', thread=thread, comments=comments)
 
 
 # --- Voting ---
-@app.route('/upvote/<int:thread_id>')
+# Called with fetch() from the templates, so there is no page to redirect back to
+@app.route(f'/upvote/<int(max={MAX_ID}):thread_id>', methods=['POST'])
 def upvote(thread_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute('UPDATE threads SET upvotes = upvotes + 1 WHERE id = %s', (thread_id,))
-    conn.commit()
-    conn.close()
-    return redirect(request.referrer or '/')
+    record_vote('threads', 'up', thread_id)
+    return '', 204
 
 
-@app.route('/downvote/<int:thread_id>')
+@app.route(f'/downvote/<int(max={MAX_ID}):thread_id>', methods=['POST'])
 def downvote(thread_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute('UPDATE threads SET downvotes = downvotes + 1 WHERE id = %s', (thread_id,))
-    conn.commit()
-    conn.close()
-    return redirect(request.referrer or '/')
+    record_vote('threads', 'down', thread_id)
+    return '', 204
 
 
-@app.route('/comment/upvote/<int:comment_id>')
+@app.route(f'/comment/upvote/<int(max={MAX_ID}):comment_id>', methods=['POST'])
 def comment_upvote(comment_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute('UPDATE comments SET upvotes = upvotes + 1 WHERE id = %s', (comment_id,))
-    conn.commit()
-    conn.close()
-    return redirect(request.referrer or '/')
+    record_vote('comments', 'up', comment_id)
+    return '', 204
 
 
-@app.route('/comment/downvote/<int:comment_id>')
+@app.route(f'/comment/downvote/<int(max={MAX_ID}):comment_id>', methods=['POST'])
 def comment_downvote(comment_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute('UPDATE comments SET downvotes = downvotes + 1 WHERE id = %s', (comment_id,))
-    conn.commit()
-    conn.close()
-    return redirect(request.referrer or '/')
+    record_vote('comments', 'down', comment_id)
+    return '', 204
 
 
 # --- Tag Filter ---
 @app.route('/tag/<tag>')
+@cache.cached(make_cache_key=listing_cache_key)
 def tag_filter(tag):
-    page = int(request.args.get('page', 1))
+    before = clamp(request.args.get('before', MAX_ID, type=int), 0, MAX_ID)
     per_page = 5
-    offset = (page - 1) * per_page
 
-    conn = get_conn()
-    c = conn.cursor()
+    with get_conn() as conn:
+        c = conn.cursor()
 
-    # Count total threads for this tag
-    c.execute("SELECT COUNT(*) FROM threads WHERE tags ILIKE %s", ('%' + tag + '%',))
-    total_threads = c.fetchone()[0]
-    total_pages = math.ceil(total_threads / per_page)
+        # Fetch one extra row to know whether there is an older page
+        execute_prepared(c, 'threads_by_tag', (tag.strip(), before, per_page + 1))
+        threads = c.fetchall()
 
-    # Fetch threads for this page
-    c.execute("""
-        SELECT * FROM threads
-        WHERE tags ILIKE %s
-        ORDER BY id DESC
-        LIMIT %s OFFSET %s
-    """, ('%' + tag + '%', per_page, offset))
-    threads = c.fetchall()
-    conn.close()
+    next_before = threads[per_page - 1]['id'] if len(threads) > per_page else None
+    threads = threads[:per_page]
 
     popular_threads = get_popular_threads()
     trending_tags = get_trending_tags()
@@ -213,45 +529,36 @@ def tag_filter(tag):
         threads=threads,
         popular_threads=popular_threads,
         trending_tags=trending_tags,
-        page=page,
-        total_pages=total_pages
+        before=before if before != MAX_ID else None,
+        next_before=next_before
     )
 
 # --- Search Threads ---
 @app.route('/search')
+@cache.cached(make_cache_key=listing_cache_key)
 def search():
     query = request.args.get('q', '').strip()
-    page = int(request.args.get('page', 1))
     per_page = 5
+    page = clamp(request.args.get('page', 1, type=int), 1, MAX_ID // per_page)
     offset = (page - 1) * per_page
 
-    conn = get_conn()
-    c = conn.cursor()
+    with get_conn() as conn:
+        c = conn.cursor()
 
-    # Count total results
-    c.execute("""
-        SELECT COUNT(*) FROM threads
-        WHERE title ILIKE %s OR content ILIKE %s OR tags ILIKE %s
-    """, (f'%{query}%', f'%{query}%', f'%{query}%'))
-    total_threads = c.fetchone()[0]
-    total_pages = math.ceil(total_threads / per_page)
+        # Fetch results for current page, most relevant first, with the
+        # total match count riding along on every row
+        execute_prepared(c, 'search_threads', (query, per_page, offset))
+        rows = c.fetchall()
 
-    # Fetch results for current page
-    c.execute("""
-        SELECT * FROM threads
-        WHERE title ILIKE %s OR content ILIKE %s OR tags ILIKE %s
-        ORDER BY id DESC
-        LIMIT %s OFFSET %s
-    """, (f'%{query}%', f'%{query}%', f'%{query}%', per_page, offset))
-    results = c.fetchall()
-    conn.close()
+    total_threads = rows[0]['total'] if rows else 0
+    total_pages = math.ceil(total_threads / per_page)
 
     popular_threads = get_popular_threads()
     trending_tags = get_trending_tags()
 
     return render_template(
         'index.html',
-        threads=results,
+        threads=rows,
         popular_threads=popular_threads,
         trending_tags=trending_tags,
         page=page,
@@ -261,30 +568,38 @@ def search():
 
 # --- Helpers ---
 def get_popular_threads(limit=5):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute('SELECT * FROM threads ORDER BY (upvotes - downvotes) DESC LIMIT %s', (limit,))
-    threads = c.fetchall()
-    conn.close()
+    cached = redis_get(POPULAR_KEY)
+    if cached is not None:
+        return json.loads(cached)
+
+    with get_conn() as conn:
+        c = conn.cursor()
+        execute_prepared(c, 'popular_threads', (limit,))
+        threads = c.fetchall()
+
+    redis_setex(POPULAR_KEY, SIDEBAR_TTL, json.dumps(threads, default=str))
     return threads
 
 
 def get_trending_tags(limit=10):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute('SELECT tags FROM threads WHERE tags != \'\'')
-    all_tags = c.fetchall()
-    conn.close()
-
-    tag_count = {}
-    for row in all_tags:
-        for tag in row[0].split(','):
-            tag = tag.strip().lower()
-            if tag:
-                tag_count[tag] = tag_count.get(tag, 0) + 1
-
-    trending = sorted(tag_count.items(), key=lambda x: x[1], reverse=True)
-    return [tag for tag, _ in trending[:limit]]
+    cached = redis_get(TRENDING_KEY)
+    if cached is not None:
+        return json.loads(cached)
+
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT g.name, COUNT(*) AS n
+            FROM thread_tags tt
+            JOIN tags g ON g.id = tt.tag_id
+            GROUP BY g.id, g.name
+            ORDER BY n DESC, g.name
+            LIMIT %s
+        ''', (limit,))
+        tags = [row['name'] for row in c.fetchall()]
+
+    redis_setex(TRENDING_KEY, SIDEBAR_TTL, json.dumps(tags))
+    return tags
 
 
 if __name__ == '__main__':
@@ -0,0 +1,15 @@
+import os
+
+# Gevent workers multiplex many requests per process while they wait on
+# Postgres or Redis, so concurrency isn't capped at workers x threads
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gevent'
+# Requests beyond DB_POOL_MAX queue for a pooled connection (app.py), which
+# every worker opens up front at startup
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 100))
+
+
+def post_fork(server, worker):
+    # Let psycopg2 yield to the gevent hub instead of blocking the worker
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()